@@ -4,7 +4,6 @@ import config
 import soundfile as sf
 import sys
 import math
-import pandas as pd
 import numpy as np
 import matplotlib.pylab as plt
 import librosa
@@ -27,28 +26,19 @@ def main():
     print(f'amount of chunks: {amount_of_chunks}')
 
     # show the raw file data
-    pd.Series(data_points).plot(
-        figsize=(10, 5),
-        lw=1,
-        title=f'Raw Data for {sample_file}',
-        color=config.COLOR_PAL[0]
-    )
+    plt.figure(figsize=(10, 5))
+    plt.plot(data_points, lw=1, color=config.COLOR_PAL[0])
+    plt.title(f'Raw Data for {sample_file}')
     plt.show()
 
-    # convert the data in our format
-    chunks = np.array_split(data_points, amount_of_chunks)
-    
-    # gets the sum of each chunk and add/remove the
-    # error margin to its sum
-    chunks_data = []
-    x_axis = []
-    i = 0
-    for chunk in chunks:
-        chunk = np.abs(chunk)
-        chunk_sum = np.sum(chunk)
-        chunks_data.append(chunk_sum)
-        x_axis.append(i)
-        i += 1
+    # convert the data in our format, the remaining data points
+    # which don't fill a whole chunk are ignored
+    chunks_length = amount_of_chunks * config.BUFFER_SIZE
+    chunks = np.abs(data_points[:chunks_length]).reshape(amount_of_chunks, config.BUFFER_SIZE)
+
+    # gets the sum of each chunk
+    chunks_data = chunks.sum(axis=1, dtype=np.float32)
+    x_axis = np.arange(amount_of_chunks)
 
     # display the data
     plt.scatter(x_axis, chunks_data)
@@ -74,19 +64,30 @@ def main():
     plt.plot(D)
     plt.show()
 
-    # display spectogram
-    data_points_db = librosa.stft(data_points)
-    data_points_db_flat = librosa.amplitude_to_db(np.abs(data_points_db), ref=np.max)
+    # display spectogram, librosa computes the stft with a real fft so
+    # only the non-redundant half of the spectrum is built. We only
+    # need its magnitude, so the complex matrix isn't kept around
+    data_points_mag = np.abs(librosa.stft(data_points))
+    data_points_db = librosa.amplitude_to_db(data_points_mag, ref=np.max)
+    del data_points_mag
     plt.figure()
-    librosa.display.specshow(data_points_db_flat)
+    librosa.display.specshow(data_points_db)
     plt.colorbar()
     plt.show()
 
     # show the mel spectogram
     fig, ax = plt.subplots()
     M = librosa.feature.melspectrogram(y=data_points, sr=sr)
-    M_db = librosa.power_to_db(M, ref=np.max)
-    img = librosa.display.specshow(M_db, y_axis='mel', x_axis='time', ax=ax)
+
+    # convert the power to dB in place, this is the same as
+    # librosa.power_to_db(M, ref=np.max) without a second matrix
+    M_ref = M.max()
+    np.maximum(M, 1e-10, out=M)
+    np.log10(M, out=M)
+    M *= 10.0
+    M -= 10.0 * np.log10(max(M_ref, 1e-10))
+    np.maximum(M, M.max() - 80.0, out=M)
+    img = librosa.display.specshow(M, y_axis='mel', x_axis='time', ax=ax)
     ax.set(title='Mel spectrogram display')
     fig.colorbar(img, ax=ax, format="%+2.f dB")
     plt.show()
@@ -0,0 +1,45 @@
+#!/usr/bin/python3
+
+# NAME
+#   Compile Kernels - builds the svad_core extension
+#
+# SYNOPSIS
+#   ./compile-kernels.py
+#
+# DESCRIPTION
+#   This script compiles the kernels of svad_kernels.py ahead of time
+#   into the svad_core extension module. svad.py uses the extension
+#   if it exists, otherwise it compiles the kernels just in time on
+#   every start which delays the first comparison.
+#
+# LEGAL NOTE
+#   Written and maintained by Laura Herzog (laura-herzog@outlook.com)
+#
+#   Permission to copy and modify is granted under the GPLv3 license
+#   Project Information: https://github.com/lauratheq/svad/
+
+import os
+from numba import types
+from numba.pycc import CC
+import svad_kernels
+
+def main():
+    cc = CC('svad_core')
+
+    # put the extension next to svad.py so it can be imported from there
+    cc.output_dir = os.path.dirname(os.path.abspath(__file__))
+
+    # the stream buffer is a read only view on the data of pyaudio
+    stream_buffer = types.Array(types.int16, 1, 'C', readonly=True)
+    cc.export('abs_sum_i16', types.int64(stream_buffer))(svad_kernels.abs_sum_i16)
+
+    # the ring buffer, its head, the bounds of the samples and the
+    # holder for the amount of matching chunks of each sample
+    cc.export('count_matches', 'void(f4[:], i8, f4[:, :], f4[:, :], i4[:])')(svad_kernels.count_matches)
+
+    print('Compiling svad_core')
+    cc.compile()
+    print('svad_core compiled')
+
+if __name__ == '__main__':
+    main()
@@ -1,10 +1,17 @@
-import matplotlib as plt
-from itertools import cycle
-
 SAMPLE_RATE		= 22050
 BUFFER_SIZE		= 1024
 ERROR_MARGIN    = 50 # in percentile
 LOG_LEVEL       = 'DEBUG'
 
-COLOR_PAL = plt.rcParams["axes.prop_cycle"].by_key()["color"]
-COLOR_CYCLE = cycle(plt.rcParams["axes.prop_cycle"].by_key()["color"])
+def __getattr__(name):
+    # the colors are only needed by the plotting scripts, so matplotlib
+    # is only imported once COLOR_PAL or COLOR_CYCLE is accessed
+    if name in ("COLOR_PAL", "COLOR_CYCLE"):
+        import matplotlib as plt
+        from itertools import cycle
+
+        global COLOR_PAL, COLOR_CYCLE
+        COLOR_PAL = plt.rcParams["axes.prop_cycle"].by_key()["color"]
+        COLOR_CYCLE = cycle(plt.rcParams["axes.prop_cycle"].by_key()["color"])
+        return globals()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
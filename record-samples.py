@@ -1,17 +1,24 @@
 #!/usr/bin/python3
 
-import pyaudio, wave, config
+import pyaudio, wave, config, sys, os
 
 def main():
     buffer_size = config.BUFFER_SIZE
     sample_rate = config.SAMPLE_RATE
-    sample_format = pyaudio.paFloat32
+    sample_format = pyaudio.paInt16
     channels = 1
     seconds = 2
     filename = 'samples/sample-03.wav'
 
     p = pyaudio.PyAudio()
 
+    # open the file before recording so every buffer can be written
+    # right away instead of collecting all of them in memory
+    wf = wave.open(filename, 'wb')
+    wf.setnchannels(channels)
+    wf.setsampwidth(p.get_sample_size(sample_format))
+    wf.setframerate(sample_rate)
+
     print('Recording')
 
     stream = p.open(
@@ -22,10 +29,9 @@ def main():
         input=True
     )
 
-    frames = []
     for i in range(0, int(sample_rate / buffer_size * seconds)):
         data = stream.read(buffer_size)
-        frames.append(data)
+        wf.writeframesraw(data)
     
     stream.stop_stream()
     stream.close()
@@ -33,13 +39,7 @@ def main():
 
     print('Finished recording')
 
-    print('Saving file')
-
-    wf = wave.open(filename, 'wb')
-    wf.setnchannels(channels)
-    wf.setsampwidth(p.get_sample_size(sample_format))
-    wf.setframerate(sample_rate)
-    wf.writeframes(b''.join(frames))
+    # closing the file writes the final length to the header
     wf.close()
 
     print('File saved')
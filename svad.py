@@ -49,14 +49,32 @@ import config
 # import python standard libraries
 import logging
 import os
-import librosa
 import math
 import numpy as np
+import soundfile as sf
 import pyaudio
 import sys
+import queue
+import threading
 import getopt
 from glob import glob
-import pymsgbox
+
+# the kernels for the hot paths are compiled ahead of time into the
+# svad_core extension by compile-kernels.py. If the extension hasn't
+# been built, we compile them just in time with numba instead. Without
+# numba the plain python kernels are used, which is still fast enough
+# for the few chunks per second of the microphone stream
+try:
+    from svad_core import abs_sum_i16, count_matches
+except ImportError:
+    import svad_kernels
+    try:
+        from numba import njit
+        abs_sum_i16 = njit(cache=True)(svad_kernels.abs_sum_i16)
+        count_matches = njit(cache=True)(svad_kernels.count_matches)
+    except ImportError:
+        abs_sum_i16 = svad_kernels.abs_sum_i16
+        count_matches = svad_kernels.count_matches
 
 class SVAD():
     '''
@@ -119,11 +137,35 @@ class SVAD():
     # the pyAudio instance
     p = None
 
-    # the stack dict for the chunks of each sample
+    # the queue which hands the chunk sums of the stream callback
+    # over to the comparing loop
+    stream_chunk_queue = None
+
+    # the event which is set as soon as a match has been found
+    match_found = None
+
+    # the stack dict for the chunk sums of each sample, every sample
+    # holds the arrays `sums`, `pls` and `mns` with one entry per chunk
     samples_chunk_stack = {}
 
-    # the stack list for the chunks of the input stream
-    stream_chunk_stack = []
+    # the lower bounds of the chunks of all samples, one row per sample
+    samples_chunk_mns = None
+
+    # the upper bounds of the chunks of all samples, one row per sample
+    samples_chunk_pls = None
+
+    # the amount of matching chunks of each sample
+    match_counts = None
+
+    # the ring buffer for the chunk sums of the input stream
+    stream_chunk_stack = None
+
+    # the position of the oldest chunk in the ring buffer which
+    # is overwritten next
+    stream_chunk_head = 0
+
+    # flag if the ring buffer has been filled once
+    stream_chunk_filled = False
 
     def __init__(self):
         '''
@@ -158,13 +200,13 @@ class SVAD():
                     sys.exit()
             # check if we need to overwrite the sample rate
             elif operator in ("-r", "--sample_rate"):
-                self.sample_rate = argument
+                self.sample_rate = int(argument)
             # same for the buffer size
-            elif operator in ("-b", "--buffer-size"):
-                self.buffer_size = argument
+            elif operator in ("-b", "--buffer_size"):
+                self.buffer_size = int(argument)
             # of course the error margin
             elif operator in ("-e", "--error_margin"):
-                self.error_margin = argument
+                self.error_margin = int(argument)
             # set the log level
             elif operator in ("-l", "--log_level"):
                 self.log_level = argument.upper()
@@ -196,7 +238,8 @@ class SVAD():
         The batch:
             1. converts the samples to the needed format
             2. starts the stream for the audio input via mircophone
-            3. converts the input stream to the needed format
+            3. converts the input stream to the needed format within
+               the stream callback
             4. starts the loop to compare the stream with the samples
 
         Parameters:
@@ -210,45 +253,97 @@ class SVAD():
         # which is described in the actual method
         self.convert_samples()
 
-        # load the microphone stream
-        self.stream = self.load_microphone_stream()
+        # the stream chunks are kept in a ring buffer which holds
+        # exactly as many chunks as our longest sample
+        self.stream_chunk_stack = np.zeros(self.max_chunks, dtype=np.float32)
+        self.stream_chunk_head = 0
+        self.stream_chunk_filled = False
 
-        # start the loop
-        self.logger.info("Starting comparing loop")
-        while(True):
-            # overwrite `data` with the data in the buffer
-            data = self.stream.read(self.buffer_size)
+        # the queue the stream callback hands the chunk sums over with
+        self.stream_chunk_queue = queue.SimpleQueue()
 
-            # if the chunk buffer exceedes the max chunk amount
-            # of our samples we we remove the first chunk of
-            # the microphone buffer. This is because we need to
-            # save some memory
-            if len(self.stream_chunk_stack) >= self.max_chunks:
-                self.stream_chunk_stack.pop(0)
+        # the flag which tells the stream callback to stop the stream
+        self.match_found = threading.Event()
 
-            # convert the binary data into understandable data
-            buffer_chunk_data = np.frombuffer(data, dtype=np.float32)
+        # call the kernel of the stream callback once with the same
+        # kind of read only buffer view the callback passes, so numba
+        # doesn't compile or load that version in the audio thread
+        abs_sum_i16(np.frombuffer(bytes(2 * self.buffer_size), dtype=np.int16))
+
+        # load the microphone stream, from now on every buffer is
+        # summed by the stream callback
+        self.stream = self.load_microphone_stream()
 
-            # make every datapoint positive to make it easier calculating
-            buffer_chunk_data = np.abs(buffer_chunk_data)
+        # the attributes used for every chunk are bound to locals
+        stream_chunk_get = self.stream_chunk_queue.get
+        stream_chunk_stack = self.stream_chunk_stack
+        stream_chunk_head = self.stream_chunk_head
+        stream_chunk_filled = self.stream_chunk_filled
+        max_chunks = self.max_chunks
 
-            # sum the data
-            buffer_chunk_sum = np.sum(buffer_chunk_data)
+        # start the loop
+        self.logger.info("Starting comparing loop")
+        while(True):
+            # wait for the next chunk sum of the stream callback. We
+            # wait in small steps so a KeyboardInterrupt still reaches us
+            try:
+                buffer_chunk_sum = stream_chunk_get(timeout=0.5)
+            except queue.Empty:
+                continue
 
-            # append the buffer to the stack
-            self.stream_chunk_stack.append(buffer_chunk_sum)
+            # write the sum to the ring buffer, this overwrites the
+            # oldest chunk once the buffer is filled
+            stream_chunk_stack[stream_chunk_head] = buffer_chunk_sum
+            stream_chunk_head = (stream_chunk_head + 1) % max_chunks
+            if stream_chunk_head == 0 and stream_chunk_filled == False:
+                stream_chunk_filled = True
+                self.stream_chunk_filled = True
 
             # we donot start the compare algorythm until we have enough
             # chunks filled with our data
-            if len(self.stream_chunk_stack) < self.max_chunks:
+            if stream_chunk_filled == False:
                 continue
-            
-            # the buffer is filled, we now can compare the stuff
+
+            # the buffer is filled, we now can compare the stuff.
+            # compare_data reads the ring buffer from its head
+            self.stream_chunk_head = stream_chunk_head
             if self.compare_data() == True:
-                self.logger.info("Match has been found")
-                self.msg_box('Match found', 'The phrase "OK BOOMER" has been detected. Microphone is now offline.')
+                self.match_found.set()
                 break
 
+        self.logger.info("Match has been found")
+        self.msg_box('Match found', 'The phrase "OK BOOMER" has been detected. Microphone is now offline.')
+
+    def stream_callback(self, in_data, frame_count, time_info, status):
+        '''
+        Handles a buffer of the microphone stream. PyAudio calls this
+        from its own thread as soon as the buffer is filled, so it only
+        sums the buffer and leaves the comparing to the main thread
+
+        Parameters:
+            self (obj): the class object
+            in_data (bytes): the data in the buffer
+            frame_count (int): the amount of frames in the buffer
+            time_info (dict): the timing information of the buffer
+            status (int): the status flags of the stream
+
+        Returns:
+            tuple: no output data and the flag if the stream continues
+        '''
+
+        # the comparing loop found a match, so we stop the stream
+        if self.match_found.is_set():
+            return (None, pyaudio.paComplete)
+
+        # convert the binary data into understandable data and sum
+        # the absolute values of every datapoint. np.frombuffer only
+        # creates a view on the buffer, nothing is copied here
+        buffer_chunk_sum = abs_sum_i16(np.frombuffer(in_data, dtype=np.int16))
+
+        # hand the sum over to the comparing loop
+        self.stream_chunk_queue.put(buffer_chunk_sum)
+        return (None, pyaudio.paContinue)
+
     def compare_data(self):
         '''
         Compares the data
@@ -259,39 +354,38 @@ class SVAD():
         Returns:
             bool
         '''
-        # walk each sample and load the data
-        for sample_name in self.samples_chunk_stack:
-            # get the data of the sample
-            sample_data = self.samples_chunk_stack[sample_name]
-
-            # walk the input stream chunk data and compare with the sample data
-            i = 0
-            chunk_match_hits = 0
-            for stream_sum in self.stream_chunk_stack:
-                # get the data to compare
-                particular_sample_chunk_data = sample_data.get(i)
-                particular_stream_chunk_data = self.stream_chunk_stack[i]
-                if particular_sample_chunk_data and particular_stream_chunk_data:
-                    # check if the values are within the error margin
-                    if particular_sample_chunk_data["mns"] <= particular_stream_chunk_data <= particular_sample_chunk_data["pls"]:
-                        chunk_match_hits += 1
-                i += 1
-
-            # check how many chunk match hits we have for this sample
-            # we respect the error margin here as well
-            self.logger.debug(f"Chunk matches: {chunk_match_hits}")
-
-            # compare the amount of chunk matches with the error margin
-            if self.max_chunks_mns <= chunk_match_hits <= self.max_chunks_pls:
+        # count the stream chunks which are within the error margin
+        # of the according sample chunk for all samples at once
+        count_matches(
+            self.stream_chunk_stack,
+            self.stream_chunk_head,
+            self.samples_chunk_mns,
+            self.samples_chunk_pls,
+            self.match_counts
+        )
+
+        # check how many chunk match hits we have for each sample
+        # we respect the error margin here as well. This runs for every
+        # buffer, so the message is only formatted if it is logged
+        self.logger.debug("Chunk matches: %s", self.match_counts)
+
+        # compare the amount of chunk matches with the error margin,
+        # one matching sample is enough
+        max_chunks_mns = self.max_chunks_mns
+        max_chunks_pls = self.max_chunks_pls
+        for chunk_match_hits in self.match_counts:
+            if max_chunks_mns <= chunk_match_hits <= max_chunks_pls:
                 return True
-            else:
-                return False
+
+        # none of the samples matches the stream
+        return False
 
     def convert_samples(self):
         '''
         Loads the samples of the given path and calculates the sum
         of all data points. It also adds and removes the error margin
-        and saves it in the samples_chunk_stack
+        and saves it in the samples_chunk_stack. Already converted
+        samples are loaded from their cache file
 
         Parameters:
             self (obj): the object class
@@ -313,53 +407,197 @@ class SVAD():
             # the dataset
             self.samples_chunk_stack[sample_file] = []
 
-            # load the dataset 
-            data_points, sr = librosa.load(sample_file)
-            data_shape = data_points.shape
-
-            # dividing the dataset into chunks the size of the defined buffer
-            amount_of_chunks = math.floor(data_shape[0] / self.buffer_size )
-
-            # set the maximum amount of chunks so we can calculate the
-            # needed amount of chunks within the error margin
-            if amount_of_chunks > self.max_chunks:
-                self.max_chunks = amount_of_chunks
-                max_chunks_five = int(self.max_chunks) * int(self.error_margin) / 100
-                self.max_chunks_pls = self.max_chunks + max_chunks_five
-                self.max_chunks_mns = self.max_chunks - max_chunks_five
-
-            chunks = np.array_split(data_points, amount_of_chunks)
-
-            self.logger.debug(f"debug info for {sample_file_name}")
-            self.logger.debug(f"    shape data_points: {data_points.shape[0]}")
-            self.logger.debug(f"    amount of chunks: {amount_of_chunks}")
-
-            # gets the sum of each chunk and add/remove the
-            # error margin to its sum
-            i = 0
-            chunks_data = {}
-            for chunk in chunks:
-                # make everything positive
-                chunk = np.abs(chunk)
-
-                # sum the array
-                chunk_sum = np.sum(chunk)
-
-                # calculate the error margin for this sample
-                chunk_five = float(chunk_sum) * int(self.error_margin) / 100
-                chunk_data = {
-                    "sum": chunk_sum,
-                    "pls": chunk_sum + chunk_five,
-                    "mns": chunk_sum - chunk_five
-                }
-                chunks_data[i] = chunk_data
-                i += 1
+            # the cache holds the already converted data of the sample,
+            # this saves us decoding the sample on every start
+            chunks_data = self.load_sample_cache(sample_file)
+            if chunks_data is None:
+                chunks_data = self.convert_sample(sample_file)
+                self.save_sample_cache(sample_file, chunks_data)
+            else:
+                self.logger.debug(f"Using cached data for {sample_file_name}")
+
+            # set the maximum amount of chunks of all samples
+            self.max_chunks = max(self.max_chunks, chunks_data["sums"].shape[0])
 
             # add the data to the stack
             self.samples_chunk_stack[sample_file] = chunks_data
             self.logger.debug(f"Loading {sample_file_name} done")
+
+        # calculate the needed amount of chunk matches within the error
+        # margin. The amount of matches is always an integer, so the
+        # bounds are rounded inwards to integers once
+        max_chunks_five = self.max_chunks * self.error_margin / 100
+        self.max_chunks_pls = math.floor(self.max_chunks + max_chunks_five)
+        self.max_chunks_mns = math.ceil(self.max_chunks - max_chunks_five)
+        self.logger.debug(f"Needed chunk matches: {self.max_chunks_mns} - {self.max_chunks_pls}")
+
+        # stack the bounds of all samples so they can be compared in
+        # one go. Samples with less chunks than the longest one are
+        # padded with bounds no stream chunk can be within
+        amount_of_samples = len(self.samples_chunk_stack)
+        self.samples_chunk_mns = np.full((amount_of_samples, self.max_chunks), np.inf, dtype=np.float32)
+        self.samples_chunk_pls = np.full((amount_of_samples, self.max_chunks), -np.inf, dtype=np.float32)
+        for sample, chunks_data in enumerate(self.samples_chunk_stack.values()):
+            amount_of_chunks = chunks_data["sums"].shape[0]
+            self.samples_chunk_mns[sample, :amount_of_chunks] = chunks_data["mns"]
+            self.samples_chunk_pls[sample, :amount_of_chunks] = chunks_data["pls"]
+
+        # holder for the amount of matching chunks of each sample
+        self.match_counts = np.zeros(amount_of_samples, dtype=np.int32)
         self.logger.info("Samples loaded")
 
+    def convert_sample(self, sample_file):
+        '''
+        Loads a single sample file and calculates the sum of the
+        data points of each chunk including the error margin
+
+        Parameters:
+            self (obj): the object class
+            sample_file (str): the path to the sample file
+
+        Returns:
+            chunks_data (dict): the arrays `sums`, `pls` and `mns`
+        '''
+        sample_file_name = os.path.basename(sample_file)
+
+        # load the dataset, samples recorded with record-samples.py
+        # already are in the format of the microphone stream
+        data_points, sr = sf.read(sample_file, dtype='float32', always_2d=True)
+
+        # the microphone stream is mono, so we mix down all channels
+        if data_points.shape[1] > 1:
+            data_points = data_points.mean(axis=1)
+        else:
+            data_points = data_points[:, 0]
+
+        # only resample the dataset if it doesn't match the sample rate
+        # of the microphone stream. librosa is only loaded in that case
+        # because importing it takes a while
+        if sr != self.sample_rate:
+            self.logger.debug(f"Resampling {sample_file_name} from {sr} to {self.sample_rate}")
+            import librosa
+            data_points = librosa.resample(data_points, orig_sr=sr, target_sr=self.sample_rate)
+
+        # scale the dataset from floats between -1 and 1 to the int16
+        # range of the microphone stream. The scaling is done in place
+        # so only the int16 array is allocated
+        data_points *= 32768
+        np.clip(data_points, -32768, 32767, out=data_points)
+        data_points = data_points.astype(np.int16)
+        data_shape = data_points.shape
+
+        # dividing the dataset into chunks the size of the defined buffer
+        amount_of_chunks = math.floor(data_shape[0] / self.buffer_size )
+
+        self.logger.debug(f"debug info for {sample_file_name}")
+        self.logger.debug(f"    shape data_points: {data_points.shape[0]}")
+        self.logger.debug(f"    amount of chunks: {amount_of_chunks}")
+
+        # gets the sum of each chunk in one go, the remaining
+        # data points which don't fill a whole chunk are ignored.
+        # the data points are widened to int32 within the same pass
+        # which makes them positive, the reshape is only a view on it
+        chunks_length = amount_of_chunks * self.buffer_size
+        chunks = np.abs(data_points[:chunks_length], dtype=np.int32).reshape(amount_of_chunks, self.buffer_size)
+        sums = chunks.sum(axis=1, dtype=np.float32)
+
+        # add/remove the error margin to the sums, the factor is a
+        # float32 as well so the bounds stay float32 like the stream
+        margin = sums * np.float32(self.error_margin / 100.0)
+        chunks_data = {
+            "sums": sums,
+            "pls": sums + margin,
+            "mns": sums - margin
+        }
+        return chunks_data
+
+    def get_sample_cache(self, sample_file):
+        '''
+        Determines the path of the cache file of a sample and the hash
+        which identifies the current state of the sample file. The size
+        and modification time of the sample are enough for that
+
+        Parameters:
+            self (obj): the object class
+            sample_file (str): the path to the sample file
+
+        Returns:
+            cache_file (str): the path to the cache file
+            sample_hash (str): the hash of the sample file
+        '''
+        cache_file = os.path.splitext(sample_file)[0] + ".svad.npz"
+        sample_stat = os.stat(sample_file)
+        sample_hash = f"{sample_stat.st_size}-{sample_stat.st_mtime_ns}"
+        return cache_file, sample_hash
+
+    def load_sample_cache(self, sample_file):
+        '''
+        Loads the converted data of a sample from its cache file. The
+        cache is only used if it belongs to the current state of the
+        sample file and was created with the same settings
+
+        Parameters:
+            self (obj): the object class
+            sample_file (str): the path to the sample file
+
+        Returns:
+            chunks_data (dict|None): the arrays `sums`, `pls` and `mns`
+                                     or None if there is no valid cache
+        '''
+        cache_file, sample_hash = self.get_sample_cache(sample_file)
+        if os.path.isfile(cache_file) == False:
+            return None
+
+        try:
+            with np.load(cache_file) as cache:
+                # the cache is outdated if the sample or the settings changed
+                if (str(cache["hash"]) != sample_hash
+                        or int(cache["error_margin"]) != self.error_margin
+                        or int(cache["sample_rate"]) != self.sample_rate
+                        or int(cache["buffer_size"]) != self.buffer_size):
+                    return None
+
+                chunks_data = {
+                    "sums": cache["sums"].astype(np.float32, copy=False),
+                    "pls": cache["pls"].astype(np.float32, copy=False),
+                    "mns": cache["mns"].astype(np.float32, copy=False)
+                }
+        except KeyError:
+            # the cache was written by an older version of this script
+            return None
+        except (OSError, ValueError) as error:
+            self.logger.warning(f"Unable to read cache file {cache_file}: {error}")
+            return None
+        return chunks_data
+
+    def save_sample_cache(self, sample_file, chunks_data):
+        '''
+        Saves the converted data of a sample to its cache file
+
+        Parameters:
+            self (obj): the object class
+            sample_file (str): the path to the sample file
+            chunks_data (dict): the arrays `sums`, `pls` and `mns`
+
+        Returns:
+            void
+        '''
+        cache_file, sample_hash = self.get_sample_cache(sample_file)
+        try:
+            np.savez(
+                cache_file,
+                sums=chunks_data["sums"],
+                pls=chunks_data["pls"],
+                mns=chunks_data["mns"],
+                error_margin=self.error_margin,
+                sample_rate=self.sample_rate,
+                buffer_size=self.buffer_size,
+                hash=sample_hash
+            )
+        except OSError as error:
+            # the samples still work without a cache, so we only warn
+            self.logger.warning(f"Unable to write cache file {cache_file}: {error}")
+
     def load_microphone_stream(self):
         '''
         Loads the microphone stream using pyaudio
@@ -379,7 +617,7 @@ class SVAD():
         stream = self.p.open(
             # format is the same as in the sample recoder
             # see record-samples.py
-            format=pyaudio.paFloat32,
+            format=pyaudio.paInt16,
             
             # we only use mono, that's enough
             channels=1,
@@ -391,7 +629,10 @@ class SVAD():
             frames_per_buffer=self.buffer_size,
 
             # input flag for the microphone to use
-            input=True
+            input=True,
+
+            # every buffer is handed to our callback
+            stream_callback=self.stream_callback
         )
         return stream
 
@@ -467,6 +708,9 @@ class SVAD():
         Returns:
             pymsg - the message box
         '''
+        # pymsgbox pulls in a whole gui toolkit and is only needed
+        # once a match has been found, so we import it here
+        import pymsgbox
         return pymsgbox.alert(content, title)
 
 # We only need to start the system if this file is called
@@ -0,0 +1,72 @@
+# NAME
+#   SVAD Kernels - the number crunching parts of SVAD
+#
+# DESCRIPTION
+#   This module holds the kernels which are called for every buffer
+#   of the microphone stream. They are plain python functions which
+#   are either compiled ahead of time by compile-kernels.py or just in
+#   time with numba when svad.py is started.
+#
+# LEGAL NOTE
+#   Written and maintained by Laura Herzog (laura-herzog@outlook.com)
+#
+#   Permission to copy and modify is granted under the GPLv3 license
+#   Project Information: https://github.com/lauratheq/svad/
+
+import numpy as np
+
+def abs_sum_i16(data):
+    '''
+    Sums the absolute values of the given data points in a single
+    pass without creating an intermediate array. Every data point is
+    widened before taking its absolute value so -32768 can't overflow
+
+    Parameters:
+        data (ndarray): the int16 data points of a chunk
+
+    Returns:
+        int: the sum of the absolute data points
+    '''
+    chunk_sum = 0
+    for i in range(data.shape[0]):
+        chunk_sum += abs(np.int32(data[i]))
+    return chunk_sum
+
+def count_matches(stream, head, mns, pls, match_counts):
+    '''
+    Counts the stream chunks which are within the error margin of
+    the according sample chunk for every sample at once. The stream
+    is a ring buffer which is read from the oldest chunk at `head`
+    to the newest one. It is read in two parts, from `head` to its
+    end and from its start to `head`, so no modulo is needed
+
+    Parameters:
+        stream (ndarray): the ring buffer with the stream chunk sums
+        head (int): the position of the oldest chunk in the ring buffer
+        mns (ndarray): the sample chunk sums minus the error margin,
+                       one row per sample
+        pls (ndarray): the sample chunk sums plus the error margin,
+                       one row per sample
+        match_counts (ndarray): receives the amount of matching
+                                chunks of every sample
+
+    Returns:
+        void
+    '''
+    # the amount of chunks stays a runtime value on purpose. Baking it
+    # in would need a freshly compiled kernel per sample set, which the
+    # svad_core extension can't provide and which the numba cache can't
+    # store for generated code. Most of the gain comes from avoiding
+    # the modulo anyway, which the two loops below already do
+    amount_of_chunks = stream.shape[0]
+    for sample in range(mns.shape[0]):
+        chunk_match_hits = 0
+        for i in range(amount_of_chunks - head):
+            stream_sum = stream[head + i]
+            chunk_match_hits += (mns[sample, i] <= stream_sum) & (stream_sum <= pls[sample, i])
+        for i in range(head):
+            stream_sum = stream[i]
+            offset = amount_of_chunks - head + i
+            chunk_match_hits += (mns[sample, offset] <= stream_sum) & (stream_sum <= pls[sample, offset])
+        match_counts[sample] = chunk_match_hits
+